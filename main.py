@@ -1,8 +1,7 @@
-import requests
 import json
 import math
-from collections import defaultdict
-from tabulate import tabulate # For nice table formatting (install with: pip install tabulate)
+# requests (pip install requests) and ijson (pip install ijson) are imported inside
+# fetch_findings so configuration errors exit without paying for those imports
  
 # --- Configuration ---
  
@@ -22,7 +21,7 @@ COOKIE = ''
 API_URL = f"https://cantina.xyz/api/v0/repositories/{REPO_ID}/findings"
  
 PARAMS = {
-    "limit": 2000, # Increased limit to fetch more/all findings if needed
+    "limit": 2000, # Page size; pages are requested until an empty page comes back
     "with_events": "false",
     "with_files": "true",
     "duplicates": "true",
@@ -43,6 +42,28 @@ HEADERS = {
 }
 # --- End Configuration ---
  
+# Shared session so repeated requests reuse pooled keep-alive connections (created on first use)
+_SESSION = None
+ 
+def get_session():
+    """Returns the shared requests.Session, creating it on first use."""
+    global _SESSION
+    if _SESSION is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+ 
+        _SESSION = requests.Session()
+        _SESSION.mount('https://', HTTPAdapter(
+            pool_connections=10,
+            pool_maxsize=10,
+            max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
+        ))
+    return _SESSION
+ 
+# Scale factors keyed by submitter count n, filled in on first use
+_SCALE_CACHE = {}
+ 
 def calculate_scaled_points(base_points, n):
     """Calculates points scaled for n unique submitters."""
     if n <= 0:
@@ -50,21 +71,57 @@ def calculate_scaled_points(base_points, n):
     if n == 1:
         return base_points # No scaling for unique findings
     # Formula: Base Points * 0.9^(n-1) / n
-    scale_factor = math.pow(0.9, n - 1) / n
+    try:
+        scale_factor = _SCALE_CACHE[n]
+    except KeyError:
+        scale_factor = _SCALE_CACHE[n] = math.pow(0.9, n - 1) / n
     return base_points * scale_factor
  
 def fetch_findings(url, params, headers):
-    """Fetches findings data from the API."""
+    """Fetches all findings from the API page by page, streaming each page out of the response body."""
+    import requests
+    import urllib3
+    import ijson
+ 
     print(f"Fetching findings from {url}...")
+    session = get_session()
+    page_size = params['limit']
+    findings = []
     try:
-        response = requests.get(url, params=params, headers=headers, timeout=60) # Increased timeout
-        response.raise_for_status() # Raise an exception for bad status codes (4xx or 5xx)
-        print(f"Successfully fetched data (Status: {response.status_code}).")
-        return response.json()
-    except requests.exceptions.Timeout:
+        session.headers.update(headers) # Set once on the session instead of per request
+        while True:
+            offset = len(findings)
+            page_params = {**params, 'offset': offset}
+            with session.get(url, params=page_params, stream=True, timeout=60) as response: # Increased timeout
+                if not response.ok:
+                    # Buffer the error body now; the streamed response is closed by the time it's reported
+                    _ = response.content
+                response.raise_for_status() # Raise an exception for bad status codes (4xx or 5xx)
+                response.raw.decode_content = True # Let urllib3 undo any Content-Encoding
+                # Parse findings one at a time instead of buffering and decoding the whole body.
+                # ijson picks its C (yajl2_c) backend when available; use_float skips building Decimals.
+                page = list(ijson.items(response.raw, 'findings.item', use_float=True))
+            print(f"Fetched {len(page)} findings at offset {offset} (Status: {response.status_code}).")
+ 
+            if not page:
+                break
+ 
+            # Guard against a server that ignores 'offset' and keeps returning the first page
+            if findings and page[:1] == findings[:1]:
+                if len(findings) == len(page) and len(page) < page_size:
+                    break # The first page was not full, so it already held every finding
+                # Carrying on with a partial list would misallocate the prize pot
+                print(f"Error: API ignored 'offset' and returned the first page again after {len(findings)} findings; results may be truncated.")
+                return None
+            findings.extend(page)
+        print(f"Successfully fetched {len(findings)} findings.")
+        return findings
+    # Reading response.raw bypasses requests' exception wrapping, so urllib3 errors raised
+    # while the body streams in are handled alongside their requests counterparts
+    except (requests.exceptions.Timeout, urllib3.exceptions.ReadTimeoutError):
         print(f"Error: Request timed out after 60 seconds while fetching from {url}.")
         return None
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, urllib3.exceptions.HTTPError) as e:
         print(f"Error fetching data: {e}")
         if hasattr(e, 'response') and e.response is not None:
             print(f"Response status code: {e.response.status_code}")
@@ -75,137 +132,142 @@ def fetch_findings(url, params, headers):
             except json.JSONDecodeError:
                 print(f"Response text: {e.response.text[:500]}...") # Print first 500 chars if not JSON
         return None
-    except json.JSONDecodeError as e:
+    except ijson.JSONError as e:
+        # The body has already been consumed by the parser, so there is no text left to show
         print(f"Error decoding JSON response: {e}")
-        # Check if response object exists before accessing text
-        if 'response' in locals() and response is not None:
-             print(f"Response text: {response.text[:500]}...")
-        else:
-             print("No response object available to show text.")
         return None
  
  
-def process_payouts(data, prize_pot):
-    """Processes findings data and calculates payouts."""
-    if not data or 'findings' not in data:
+def process_payouts(findings, prize_pot):
+    """Processes the list of findings and calculates payouts."""
+    if not findings:
         print("No findings data found or data is not in the expected format.")
         return
  
-    findings = data['findings']
     print(f"\nProcessing {len(findings)} raw findings entries...")
  
     confirmed_originals = {} # Store original confirmed findings: {id: finding_data}
-    all_valid_submissions = defaultdict(list) # {original_id: [(user_id, user_name, severity, finding_id), ...]}
+    submitters_by_orig = {} # {original_id: {user_id, ...}}
+    orig_severity = {} # {original_id: severity of the original confirmed finding}
     user_details = {} # {user_id: user_name}
  
-    # --- Step 1: Identify all confirmed original findings ---
-    for finding in findings:
-        # Basic validation of finding structure
-        if not isinstance(finding, dict):
-            print(f"Warning: Skipping invalid finding entry (not a dictionary): {finding}")
-            continue
-        if finding.get('status') == 'confirmed':
-            finding_id = finding.get('id')
-            if finding_id:
-                confirmed_originals[finding_id] = finding
- 
-    if not confirmed_originals:
-        print("No 'confirmed' findings found in the dataset. Cannot process payouts.")
-        return
+    # Local aliases for names used once per finding (LOAD_FAST instead of global/attribute lookups)
+    base_points_map = BASE_POINTS
+    confirmed_get = confirmed_originals.get
  
-    print(f"Found {len(confirmed_originals)} unique confirmed findings.")
- 
-    # --- Step 2: Group all valid submissions (confirmed originals and their valid duplicates) ---
+    # --- Step 1: Single pass over findings ---
+    # Confirmed originals are recorded and grouped straight away. Duplicates can only be
+    # resolved once every confirmed original is known, so they are buffered for step 2.
     processed_finding_ids = set() # Track submission IDs to handle potential API duplicates
+    pending_duplicates = [] # [(finding_id, user_id, user_name, duplicate_of_id), ...]
+    n_confirmed = 0 # Confirmed originals with a payable severity
  
     for finding in findings:
-         # Basic validation of finding structure
+        # Basic validation of finding structure
         if not isinstance(finding, dict):
-            # Already warned in step 1, but good to have safeguard here too
+            print(f"Warning: Skipping invalid finding entry (not a dictionary): {finding}")
             continue
  
-        finding_id = finding.get('id')
+        get = finding.get # Bound once; every field below is read through it
+        finding_id = get('id')
         if not finding_id:
-             print(f"Warning: Skipping finding entry with missing ID: {finding.get('title', 'N/A')}")
+             print(f"Warning: Skipping finding entry with missing ID: {get('title', 'N/A')}")
              continue
  
         # Avoid double-processing if the API returns the same finding multiple times
-        if finding_id in processed_finding_ids:
-             continue
+        # (the set only grows when the ID is new, so a single add doubles as the membership test)
+        seen_count = len(processed_finding_ids)
         processed_finding_ids.add(finding_id)
+        if len(processed_finding_ids) == seen_count:
+             continue
  
-        created_by_info = finding.get('createdBy')
+        status = get('status')
+        if status == 'confirmed':
+            confirmed_originals[finding_id] = finding
+ 
+        severity = get('severity') # high or medium
+        if severity not in base_points_map:
+            # This filters out low severity or any other non-payable types before any further parsing.
+            # Duplicates are held to the same rule; their original's severity is checked in step 2.
+            continue
+        if status == 'confirmed':
+            n_confirmed += 1
+ 
+        created_by_info = get('createdBy')
         if not isinstance(created_by_info, dict):
-            print(f"Warning: Skipping finding '{finding.get('title', finding_id)}' due to missing/invalid 'createdBy' info.")
+            print(f"Warning: Skipping finding '{get('title', finding_id)}' due to missing/invalid 'createdBy' info.")
             continue
  
         user_id = created_by_info.get('userId')
         user_name = created_by_info.get('username', 'N/A')
-        status = finding.get('status')
-        severity = finding.get('severity') # high or medium
  
         if not user_id:
-            print(f"Warning: Skipping finding '{finding.get('title', finding_id)}' due to missing user ID.")
+            print(f"Warning: Skipping finding '{get('title', finding_id)}' due to missing user ID.")
             continue
  
-        if severity not in BASE_POINTS:
-            # This filters out low severity or any other non-payable types
-            continue
- 
-        # Store user details consistently
-        if user_id not in user_details:
-             user_details[user_id] = user_name
- 
-        original_id_to_process = None
-        original_severity = None
+        # Store user details consistently (first name seen for a user wins)
+        user_details.setdefault(user_id, user_name)
  
         if status == 'confirmed':
-            original_id_to_process = finding_id
-            original_severity = severity
+            # IDs are already deduplicated, so this is always the first submission for this original
+            submitters_by_orig[finding_id] = {user_id}
+            orig_severity[finding_id] = severity
             # print(f"Debug: Confirmed finding {finding_id} by {user_name}, severity {severity}") # Debugging line
         elif status == 'duplicate':
-            duplicate_of_info = finding.get('duplicateOf')
-            # Ensure duplicateOf_info is valid and points to a CONFIRMED original
-            if isinstance(duplicate_of_info, dict) and duplicate_of_info.get('id') in confirmed_originals:
-                original_id_ref = duplicate_of_info.get('id')
-                # Use the severity of the ORIGINAL confirmed finding for consistency
-                original_severity = confirmed_originals[original_id_ref].get('severity')
-                # Only process if the original's severity is payable
-                if original_severity in BASE_POINTS:
-                    original_id_to_process = original_id_ref
-                    # print(f"Debug: Duplicate finding {finding_id} by {user_name} of confirmed {original_id_ref}, original severity {original_severity}") # Debugging line
-            # else: it's a duplicate of a rejected/non-existent/non-confirmed original, or its original is low severity, so ignore it
- 
-        # Add to our processing list if it's valid and its original severity is payable
-        if original_id_to_process and original_severity in BASE_POINTS:
-             submission_tuple = (user_id, user_name, original_severity, finding_id)
-             all_valid_submissions[original_id_to_process].append(submission_tuple)
+            duplicate_of_info = get('duplicateOf')
+            if isinstance(duplicate_of_info, dict) and duplicate_of_info.get('id'):
+                pending_duplicates.append((finding_id, user_id, user_name, duplicate_of_info.get('id')))
         # else:
              # print(f"Debug: Skipped finding {finding_id} (status: {status}, severity: {severity})") # Debugging line
  
+    if not confirmed_originals:
+        print("No 'confirmed' findings found in the dataset. Cannot process payouts.")
+        return
+    if n_confirmed == 0:
+        # Nothing can be paid out, so don't bother resolving the buffered duplicates
+        print("No 'confirmed' High/Medium findings found in the dataset. Cannot process payouts.")
+        return
+ 
+    print(f"Found {len(confirmed_originals)} unique confirmed findings.")
+ 
+    # --- Step 2: Resolve buffered duplicates against the confirmed originals ---
+    submitters_by_orig_get = submitters_by_orig.get
+    for finding_id, user_id, user_name, original_id_ref in pending_duplicates:
+        # Ensure the duplicate points to a CONFIRMED original
+        original = confirmed_get(original_id_ref)
+        if original is None:
+            # It's a duplicate of a rejected/non-existent/non-confirmed original, so ignore it
+            continue
+        # Use the severity of the ORIGINAL confirmed finding for consistency
+        original_severity = original.get('severity')
+        # Only process if the original's severity is payable
+        if original_severity in base_points_map:
+            submitters = submitters_by_orig_get(original_id_ref)
+            if submitters is not None:
+                submitters.add(user_id)
+            else:
+                submitters_by_orig[original_id_ref] = {user_id}
+                orig_severity[original_id_ref] = original_severity
+            # print(f"Debug: Duplicate finding {finding_id} by {user_name} of confirmed {original_id_ref}, original severity {original_severity}") # Debugging line
+ 
     # --- Step 3: Calculate points per user ---
-    user_points = defaultdict(float)
-    processed_vulnerabilities = defaultdict(list) # For detailed output later
+    # Every submitter is already in user_details, so seed all totals up front and let the
+    # scatter-add below be a plain in-place += with no default handling
+    user_points = dict.fromkeys(user_details, 0.0)
+    processed_vulnerabilities = {} # {original_id: details} for detailed output later
  
-    if not all_valid_submissions:
+    if not submitters_by_orig:
         print("No valid submissions found (confirmed or duplicates of confirmed with High/Medium severity).")
         return
  
-    print(f"\nCalculating points based on {len(all_valid_submissions)} unique confirmed vulnerabilities...")
+    print(f"\nCalculating points based on {len(submitters_by_orig)} unique confirmed vulnerabilities...")
  
-    for original_id, submissions in all_valid_submissions.items():
-        if not submissions: # Should not happen based on previous logic, but safety check
-            continue
- 
-        # Determine base points from the original severity (stored in tuple index 2)
-        base_points = BASE_POINTS.get(submissions[0][2])
-        if not base_points:
-             print(f"Critical Error: Could not determine base points for vulnerability {original_id}. Severity was {submissions[0][2]}. Skipping.")
-             continue
+    for original_id, unique_users_for_vuln in submitters_by_orig.items():
+        # Determine base points from the original severity (only payable severities were ingested)
+        severity = orig_severity[original_id]
+        base_points = base_points_map[severity]
  
-        # Find unique users for *this* specific vulnerability
-        # Use user_id (index 0) to ensure uniqueness per user per vulnerability
-        unique_users_for_vuln = set(sub[0] for sub in submissions)
+        # Submitters were collected as a set of user IDs, so each user counts once per vulnerability
         n = len(unique_users_for_vuln)
  
         # Calculate points per user for this vulnerability using the scaling formula
@@ -215,15 +277,17 @@ def process_payouts(data, prize_pot):
         for user_id in unique_users_for_vuln:
             user_points[user_id] += points_per_user_for_this_vuln
  
-        # Store details for reporting
-        processed_vulnerabilities[original_id].append({
-            'title': confirmed_originals.get(original_id,{}).get('title','N/A'), # Get title from original
-            'severity': submissions[0][2],
+        # Store details for reporting, with the title looked up once from the original
+        original = confirmed_get(original_id)
+        title = original.get('title', 'N/A') if original else 'N/A'
+        processed_vulnerabilities[original_id] = {
+            'title': title,
+            'severity': severity,
             'submitters_count (n)': n,
             'base_points': base_points,
             'points_per_submitter': points_per_user_for_this_vuln,
-            'submitters': sorted([user_details.get(uid, uid) for uid in unique_users_for_vuln]) # Sort usernames
-        })
+            'submitters': sorted(user_details.get(uid, uid) for uid in unique_users_for_vuln) # Sort usernames
+        }
  
  
     # --- Step 4: Calculate total points and payouts ---
@@ -234,11 +298,9 @@ def process_payouts(data, prize_pot):
         print("No vulnerabilities qualified for point calculation.")
     else:
         # Sort vulnerabilities alphabetically by title for consistent reporting
-        sorted_vuln_ids = sorted(processed_vulnerabilities.keys(), key=lambda vid: processed_vulnerabilities[vid][0]['title'])
+        sorted_vulns = sorted(processed_vulnerabilities.items(), key=lambda item: item[1]['title'])
  
-        for orig_id in sorted_vuln_ids:
-             details_list = processed_vulnerabilities[orig_id]
-             details = details_list[0] # Should only be one entry per original_id now
+        for orig_id, details in sorted_vulns:
              print(f"\nVulnerability: {details['title']} (Original ID: {orig_id})")
              print(f"  Severity: {details['severity']} (Base Points: {details['base_points']})")
              print(f"  Unique Submitters (n): {details['submitters_count (n)']}")
@@ -248,6 +310,7 @@ def process_payouts(data, prize_pot):
  
     print("\n--- Payout Calculation ---")
     payout_data = []
+    total_payout_calculated = 0.0 # Accumulated while building payout_data, used for the totals row and sanity check
     if total_points_awarded > 0:
         # Use Decimal for potentially better precision with currency? Or stick to float for simplicity? Float is fine for now.
         payout_per_point = prize_pot / total_points_awarded
@@ -256,24 +319,37 @@ def process_payouts(data, prize_pot):
         print(f"Payout per Point: ${payout_per_point:.4f}")
  
         for user_id, points in user_points.items():
+            if not points:
+                continue # Seeded user whose submissions were all skipped
             payout = points * payout_per_point
+            total_payout_calculated += payout
             user_name = user_details.get(user_id, f"ID:{user_id}") # Fallback to ID if name missing
-            payout_data.append([user_name, f"{points:.4f}", f"${payout:,.2f}"])
+            # Keep the numeric payout next to the formatted columns for sorting and totals
+            payout_data.append((user_name, points, payout))
     else:
         print("No points awarded across all users, cannot calculate payouts.")
  
     # --- Step 5: Display Results ---
     if payout_data:
         # Sort by payout amount descending
-        payout_data.sort(key=lambda x: float(x[2].replace('$', '').replace(',', '')), reverse=True)
+        payout_data.sort(key=lambda x: x[2], reverse=True)
+ 
+        # Format the display rows only once the numeric work is done
+        table_rows = [[user_name, f"{points:.4f}", f"${payout:,.2f}"] for user_name, points, payout in payout_data]
+ 
+        totals_row = ['TOTALS', f"{total_points_awarded:.4f}", f"${total_payout_calculated:,.2f}"]
+        header_row = ["Username", "Total Points", "Payout"]
  
-        # Add Totals row
-        total_payout_calculated = sum(float(row[2].replace('$', '').replace(',', '')) for row in payout_data)
-        payout_data.append(['---', '---', '---']) # Separator
-        payout_data.append(['TOTALS', f"{total_points_awarded:.4f}", f"${total_payout_calculated:,.2f}"])
+        # Size each column to its widest cell, then write the whole table in one print
+        w_name, w_pts, w_pay = (max(map(len, column)) for column in zip(header_row, totals_row, *table_rows))
+        rule = '-' * (w_name + w_pts + w_pay + 4)
+        lines = [f"{name:<{w_name}}  {pts:>{w_pts}}  {pay:>{w_pay}}" for name, pts, pay in (header_row, *table_rows)]
+        lines.insert(1, rule)
+        lines.append(rule)
+        lines.append(f"{totals_row[0]:<{w_name}}  {totals_row[1]:>{w_pts}}  {totals_row[2]:>{w_pay}}")
  
         print("\n--- Payout Summary Table (Per User) ---")
-        print(tabulate(payout_data, headers=["Username", "Total Points", "Payout"], tablefmt="grid"))
+        print('\n'.join(lines))
  
         # Sanity check for payout sum vs prize pot
         if not math.isclose(total_payout_calculated, prize_pot, rel_tol=1e-4) and total_points_awarded > 0:
@@ -318,11 +394,11 @@ if __name__ == "__main__":
         HEADERS['Cookie'] = COOKIE
  
         # --- Fetch Data ---
-        api_data = fetch_findings(API_URL, PARAMS, HEADERS)
+        findings = fetch_findings(API_URL, PARAMS, HEADERS)
  
         # --- Process Data ---
-        if api_data:
-            process_payouts(api_data, PRIZE_POT)
+        if findings:
+            process_payouts(findings, PRIZE_POT)
         else:
             print("\nExiting script due to data fetching error or empty data.")
     else: